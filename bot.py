@@ -1,5 +1,7 @@
 """Main bot module for Telegram CoC Agreement Bot."""
+import asyncio
 import logging
+from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
 from telegram.ext import (
     Application,
@@ -11,6 +13,7 @@ from telegram.ext import (
     filters
 )
 from telegram.constants import ChatMemberStatus
+from telegram.error import BadRequest, Forbidden, RetryAfter
 
 import config
 from config import (
@@ -20,13 +23,16 @@ from config import (
     DRY_RUN,
     WEBHOOK_URL,
     PORT,
+    RECONCILE_INTERVAL,
+    RECONCILE_BATCH_SIZE,
+    RECONCILE_PACE,
+    RECONCILE_BACKFILL,
 )
 from database_manager import DatabaseManager as StorageManager
+from logging_setup import setup_logging
+from tracing import traced, instrument, configure as configure_tracing
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 if DRY_RUN:
@@ -35,11 +41,26 @@ if DRY_RUN:
     logger.warning("All permission changes will only be logged")
     logger.warning("=" * 60)
 
-storage_manager = StorageManager()
+storage_manager = instrument(StorageManager(), "db")
 
 # Active CoC version: DB value takes precedence over env var so /setversion persists across restarts.
 _active_coc_version: str = storage_manager.get_setting('coc_version', _DEFAULT_COC_VERSION)
-logger.info(f"Active CoC version: {_active_coc_version}")
+logger.info("Active CoC version: %s", _active_coc_version)
+
+_FULL_PERMISSIONS = ChatPermissions(
+    can_send_messages=True, can_send_audios=True, can_send_documents=True,
+    can_send_photos=True, can_send_videos=True, can_send_video_notes=True,
+    can_send_voice_notes=True, can_send_polls=True, can_send_other_messages=True,
+    can_add_web_page_previews=True, can_change_info=True, can_invite_users=True,
+    can_pin_messages=True
+)
+
+_STATS_MAX_GROUPS = 50
+_STATS_DAYS = 14
+_TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Agreements younger than this are left to handle_agreement, which may still be unrestricting.
+_RECONCILE_GRACE = timedelta(seconds=60)
 
 
 def is_admin(user_id: int) -> bool:
@@ -71,6 +92,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+def _in_chat(member) -> bool:
+    # Telegram keeps a restricted user's status as RESTRICTED after they leave, with is_member=False.
+    if member.status in [ChatMemberStatus.LEFT, ChatMemberStatus.BANNED]:
+        return False
+    return member.status != ChatMemberStatus.RESTRICTED or member.is_member
+
+
 async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.chat_member:
         return
@@ -78,7 +106,11 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
     new_member = update.chat_member.new_chat_member
     old_member = update.chat_member.old_chat_member
 
-    if (old_member.status in [ChatMemberStatus.LEFT, ChatMemberStatus.BANNED] and
+    if not _in_chat(new_member):
+        await asyncio.to_thread(storage_manager.clear_restricted, new_member.user.id, update.effective_chat.id)
+        return
+
+    if (not _in_chat(old_member) and
         new_member.status in [ChatMemberStatus.MEMBER, ChatMemberStatus.RESTRICTED]):
 
         user = new_member.user
@@ -88,11 +120,13 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return
 
         if storage_manager.has_agreed(user.id, chat.id, _active_coc_version):
-            logger.info(f"Re-joining member {user.id} has already agreed.")
+            logger.info("Re-joining member %s has already agreed.", user.id,
+                        extra={'user_id': user.id, 'chat_id': chat.id})
             return
 
         if DRY_RUN:
-            logger.info(f"[DRY RUN] Would restrict new member {user.id} in chat {chat.id}")
+            logger.info("[DRY RUN] Would restrict new member %s in chat %s", user.id, chat.id,
+                        extra={'user_id': user.id, 'chat_id': chat.id})
             return
 
         try:
@@ -101,9 +135,12 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 user_id=user.id,
                 permissions=ChatPermissions(can_send_messages=False)
             )
-            logger.info(f"Restricted new member {user.id} in chat {chat.id}")
+            logger.info("Restricted new member %s in chat %s", user.id, chat.id,
+                        extra={'user_id': user.id, 'chat_id': chat.id, 'audit': True})
+            await asyncio.to_thread(storage_manager.mark_restricted, user.id, chat.id, chat.title)
         except Exception as e:
-            logger.error(f"Failed to restrict new member {user.id}: {e}")
+            logger.error("Failed to restrict new member %s: %s", user.id, e,
+                         extra={'user_id': user.id, 'chat_id': chat.id})
 
         if storage_manager.has_agreed_anywhere(user.id, _active_coc_version):
             reply_markup = _coc_confirm_keyboard(chat.id)
@@ -138,12 +175,14 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
         try:
             await context.bot.send_message(chat_id=user.id, text=dm_text, reply_markup=reply_markup)
             dm_sent = True
-            logger.info(f"Sent CoC DM to new member {user.id}")
+            logger.info("Sent CoC DM to new member %s", user.id,
+                        extra={'user_id': user.id, 'chat_id': chat.id})
         except Exception:
             pass
 
         if not dm_sent:
-            logger.warning(f"Could not DM new member {user.id}, posting group fallback")
+            logger.warning("Could not DM new member %s, posting group fallback", user.id,
+                           extra={'user_id': user.id, 'chat_id': chat.id})
             try:
                 await context.bot.send_message(
                     chat_id=chat.id,
@@ -152,7 +191,8 @@ async def handle_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     parse_mode='HTML'
                 )
             except Exception as e:
-                logger.error(f"Failed to send group fallback for new member {user.id}: {e}")
+                logger.error("Failed to send group fallback for new member %s: %s", user.id, e,
+                             extra={'user_id': user.id, 'chat_id': chat.id})
 
 
 async def handle_agreement(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -183,7 +223,7 @@ async def handle_agreement(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         chat = await context.bot.get_chat(group_id)
         group_name = chat.title
     except Exception as e:
-        logger.error(f"Failed to get chat info for {group_id}: {e}")
+        logger.error("Failed to get chat info for %s: %s", group_id, e)
         group_name = "Unknown"
 
     success = storage_manager.record_agreement(
@@ -208,17 +248,14 @@ async def handle_agreement(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             await context.bot.restrict_chat_member(
                 chat_id=group_id,
                 user_id=user.id,
-                permissions=ChatPermissions(
-                    can_send_messages=True, can_send_audios=True, can_send_documents=True,
-                    can_send_photos=True, can_send_videos=True, can_send_video_notes=True,
-                    can_send_voice_notes=True, can_send_polls=True, can_send_other_messages=True,
-                    can_add_web_page_previews=True, can_change_info=True, can_invite_users=True,
-                    can_pin_messages=True
-                )
+                permissions=_FULL_PERMISSIONS
             )
-            logger.info(f"Unrestricted user {user.id} in chat {group_id}")
+            await asyncio.to_thread(storage_manager.release_restriction, user.id, group_id)
+            logger.info("Unrestricted user %s in chat %s", user.id, group_id,
+                        extra={'user_id': user.id, 'chat_id': group_id, 'audit': True})
         except Exception as e:
-            logger.error(f"Failed to unrestrict user {user.id}: {e}")
+            logger.error("Failed to unrestrict user %s: %s", user.id, e,
+                         extra={'user_id': user.id, 'chat_id': group_id})
             await query.answer(
                 "Agreement recorded, but failed to update permissions. Please contact an admin. / "
                 "Zustimmung gespeichert, aber Berechtigungen konnten nicht aktualisiert werden. "
@@ -255,6 +292,46 @@ async def who_agreed(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     await update.message.reply_text(response)
 
 
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin command: Agreement counts per group and version, recent daily rate, pending users."""
+    user = update.effective_user
+    chat = update.effective_chat
+    if not is_admin(user.id): return
+
+    in_group = chat.type in ['group', 'supergroup']
+    since = datetime.now(timezone.utc).date() - timedelta(days=_STATS_DAYS - 1) if in_group else None
+    rows = storage_manager.get_stats(
+        chat.id if in_group else None, _active_coc_version, since, _STATS_MAX_GROUPS + 1
+    )
+    if not rows:
+        await update.message.reply_text("No statistics recorded yet.")
+        return
+
+    sections = []
+    for row in rows[:_STATS_MAX_GROUPS]:
+        versions = dict(row['totals'])
+        lines = [f"📊 {row['group_name'] or row['group_id']}"]
+        lines.append(f"Agreed to v{_active_coc_version}: {versions.pop(_active_coc_version, 0)}")
+        for version, count in sorted(versions.items()):
+            lines.append(f"Agreed to v{version}: {count}")
+        lines.append(f"Restricted, not yet agreed: {row['pending_restricted']}")
+        if row['daily']:
+            lines.append(f"\nDaily agreements (v{_active_coc_version}, last {_STATS_DAYS} days):")
+            lines.extend(f"• {day}: {count}" for day, count in row['daily'])
+        sections.append("\n".join(lines))
+    if len(rows) > _STATS_MAX_GROUPS:
+        sections.append(f"... more groups not shown (limit {_STATS_MAX_GROUPS}).")
+
+    # Telegram rejects messages over 4096 characters; send sections in as few messages as fit.
+    message = ""
+    for section in sections:
+        if message and len(message) + len(section) + 2 > _TELEGRAM_MESSAGE_LIMIT:
+            await update.message.reply_text(message)
+            message = ""
+        message = f"{message}\n\n{section}" if message else section[:_TELEGRAM_MESSAGE_LIMIT]
+    await update.message.reply_text(message)
+
+
 async def post_onboarding_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Posts the main persistent message for members to start the agreement process."""
     user = update.effective_user
@@ -296,7 +373,8 @@ async def set_version(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     _active_coc_version = new_version
-    logger.info(f"CoC version changed {old_version} → {new_version} by admin {user.id}")
+    logger.info("CoC version changed %s → %s by admin %s", old_version, new_version, user.id,
+                extra={'user_id': user.id, 'audit': True})
     await update.message.reply_text(
         f"✅ CoC version updated: {old_version} → {new_version}\n"
         f"All users must now re-agree to the Code of Conduct."
@@ -318,16 +396,19 @@ async def gatekeeper_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if storage_manager.has_agreed(user.id, chat.id, _active_coc_version):
         return
 
-    logger.info(f"Gatekeeper: blocking user={user.id} in chat={chat.id}")
+    logger.info("Gatekeeper: blocking user=%s in chat=%s", user.id, chat.id,
+                extra={'user_id': user.id, 'chat_id': chat.id})
 
     if DRY_RUN:
-        logger.info(f"[DRY RUN] Would delete message and restrict user {user.id} in {chat.id}")
+        logger.info("[DRY RUN] Would delete message and restrict user %s in %s", user.id, chat.id,
+                    extra={'user_id': user.id, 'chat_id': chat.id})
         return
 
     try:
         await message.delete()
     except Exception as e:
-        logger.error(f"Failed to delete message from user {user.id}: {e}")
+        logger.error("Failed to delete message from user %s: %s", user.id, e,
+                     extra={'user_id': user.id, 'chat_id': chat.id})
 
     try:
         await context.bot.restrict_chat_member(
@@ -335,8 +416,12 @@ async def gatekeeper_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             user_id=user.id,
             permissions=ChatPermissions(can_send_messages=False)
         )
+        logger.info("Restricted user %s in chat %s", user.id, chat.id,
+                    extra={'user_id': user.id, 'chat_id': chat.id, 'audit': True})
+        await asyncio.to_thread(storage_manager.mark_restricted, user.id, chat.id, chat.title)
     except Exception as e:
-        logger.error(f"Failed to restrict user {user.id}: {e}")
+        logger.error("Failed to restrict user %s: %s", user.id, e,
+                     extra={'user_id': user.id, 'chat_id': chat.id})
 
     if storage_manager.has_agreed_anywhere(user.id, _active_coc_version):
         reply_markup = _coc_confirm_keyboard(chat.id)
@@ -371,12 +456,13 @@ async def gatekeeper_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try:
         await context.bot.send_message(chat_id=user.id, text=dm_text, reply_markup=reply_markup)
         dm_sent = True
-        logger.info(f"Sent CoC DM to user {user.id}")
+        logger.info("Sent CoC DM to user %s", user.id, extra={'user_id': user.id, 'chat_id': chat.id})
     except Exception:
         pass
 
     if not dm_sent:
-        logger.warning(f"Could not DM user {user.id}, posting group fallback")
+        logger.warning("Could not DM user %s, posting group fallback", user.id,
+                       extra={'user_id': user.id, 'chat_id': chat.id})
         try:
             await context.bot.send_message(
                 chat_id=chat.id,
@@ -385,25 +471,88 @@ async def gatekeeper_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 parse_mode='HTML'
             )
         except Exception as e:
-            logger.error(f"Failed to send group fallback for user {user.id}: {e}")
+            logger.error("Failed to send group fallback for user %s: %s", user.id, e,
+                         extra={'user_id': user.id, 'chat_id': chat.id})
 
 
-def main() -> None:
-    """Start the bot."""
-    application = Application.builder().token(BOT_TOKEN).build()
+async def reconcile_restrictions(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job: unrestrict users the bot restricted whose agreement is recorded but didn't take effect.
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("whoagreed", who_agreed))
-    application.add_handler(CommandHandler("post_onboarding", post_onboarding_message))
-    application.add_handler(CommandHandler("setversion", set_version))
+    Works through the restrictions that were never confirmed lifted, oldest agreement first.
+    Rows are released once handled, so each run only sees what is still outstanding.
+    """
+    if RECONCILE_BACKFILL and not storage_manager.get_setting('reconcile_backfilled', ''):
+        if storage_manager.queue_reconcile_backfill(_active_coc_version):
+            storage_manager.set_setting('reconcile_backfilled', _active_coc_version)
 
-    application.add_handler(CallbackQueryHandler(handle_agreement, pattern="^(agree|confirm)_"))
-    application.add_handler(ChatMemberHandler(handle_new_member, ChatMemberHandler.CHAT_MEMBER))
-    application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, gatekeeper_handler))
+    rows = storage_manager.get_unreleased_restrictions(
+        datetime.now(timezone.utc) - _RECONCILE_GRACE, RECONCILE_BATCH_SIZE
+    )
+    if not rows:
+        return
+
+    checked = repaired = 0
+    for row in rows:
+        user_id, group_id = row['user_id'], row['group_id']
+        try:
+            member = await context.bot.get_chat_member(group_id, user_id)
+            if member.status == ChatMemberStatus.RESTRICTED and not member.can_send_messages:
+                if DRY_RUN:
+                    logger.info("[DRY RUN] Reconciler would unrestrict user %s in chat %s", user_id, group_id,
+                                extra={'user_id': user_id, 'chat_id': group_id})
+                else:
+                    await asyncio.sleep(RECONCILE_PACE)
+                    await context.bot.restrict_chat_member(
+                        chat_id=group_id,
+                        user_id=user_id,
+                        permissions=_FULL_PERMISSIONS
+                    )
+                    logger.info("Reconciler unrestricted user %s in chat %s", user_id, group_id,
+                                extra={'user_id': user_id, 'chat_id': group_id, 'audit': True})
+                repaired += 1
+        except (BadRequest, Forbidden) as e:
+            # Permanent (user not in chat, bot removed, ...): retrying won't help, release it.
+            logger.error("Reconciler skipped user %s in chat %s: %s", user_id, group_id, e,
+                         extra={'user_id': user_id, 'chat_id': group_id})
+        except RetryAfter as e:
+            # Leave this row queued so the next run picks it up again.
+            logger.warning("Reconciler rate-limited, pausing until next run (%ss)", e.retry_after)
+            break
+        except Exception as e:
+            # Timeouts, network errors, 5xx: same as above, retry this row next run.
+            logger.warning("Reconciler stopped at user %s in chat %s, retrying next run: %s",
+                           user_id, group_id, e, extra={'user_id': user_id, 'chat_id': group_id})
+            break
+        storage_manager.release_restriction(user_id, group_id)
+        checked += 1
+        await asyncio.sleep(RECONCILE_PACE)
+
+    logger.info("Reconciler checked %s agreement(s), repaired %s", checked, repaired)
+
+
+def main() -> None:
+    """Start the bot."""
+    application = configure_tracing(Application.builder().token(BOT_TOKEN)).build()
+
+    application.add_handler(CommandHandler("start", traced(start)))
+    application.add_handler(CommandHandler("whoagreed", traced(who_agreed)))
+    application.add_handler(CommandHandler("post_onboarding", traced(post_onboarding_message)))
+    application.add_handler(CommandHandler("setversion", traced(set_version)))
+    application.add_handler(CommandHandler("stats", traced(stats)))
+
+    application.add_handler(CallbackQueryHandler(traced(handle_agreement), pattern="^(agree|confirm)_"))
+    application.add_handler(ChatMemberHandler(traced(handle_new_member), ChatMemberHandler.CHAT_MEMBER))
+    application.add_handler(MessageHandler(filters.ALL & ~filters.COMMAND, traced(gatekeeper_handler)))
+
+    if RECONCILE_INTERVAL > 0:
+        application.job_queue.run_repeating(
+            reconcile_restrictions, interval=RECONCILE_INTERVAL, first=RECONCILE_INTERVAL,
+            name="reconcile_restrictions"
+        )
 
     if WEBHOOK_URL:
         url_path = BOT_TOKEN  # token as URL path provides basic request authentication
-        logger.info(f"Starting webhook on port {PORT}")
+        logger.info("Starting webhook on port %s", PORT)
         application.run_webhook(
             listen="0.0.0.0",
             port=PORT,
@@ -23,3 +23,22 @@ DRY_RUN = os.getenv('DRY_RUN', 'false').lower() == 'true'
 
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # if set, bot uses webhooks; otherwise falls back to polling
 PORT = int(os.getenv('PORT', '8443'))
+
+# Background reconciler: re-applies unrestriction for recorded agreements that didn't take effect
+RECONCILE_INTERVAL = int(os.getenv('RECONCILE_INTERVAL', '600'))  # seconds between runs; 0 disables
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '100'))  # agreements checked per run
+RECONCILE_PACE = float(os.getenv('RECONCILE_PACE', '0.2'))  # seconds between Telegram API calls
+# One-time: also check agreements recorded before restrictions were tracked (lifts any mute on them)
+RECONCILE_BACKFILL = os.getenv('RECONCILE_BACKFILL', 'false').lower() == 'true'
+
+# Per-update tracing (off by default): logs a span breakdown for updates slower than SLOW_UPDATE_MS
+TRACE_UPDATES = os.getenv('TRACE_UPDATES', 'false').lower() == 'true'
+SLOW_UPDATE_MS = float(os.getenv('SLOW_UPDATE_MS', '1000'))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fraction of traced updates aggregated
+PROFILE_DUMP_EVERY = int(os.getenv('PROFILE_DUMP_EVERY', '200'))  # sampled updates per profile dump
+
+# Logging: records are written by a background thread; repeats of the same message are sampled
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()  # 'json' or 'text'
+LOG_SAMPLE_LIMIT = int(os.getenv('LOG_SAMPLE_LIMIT', '20'))  # per message template per window; 0 disables
+LOG_SAMPLE_WINDOW = float(os.getenv('LOG_SAMPLE_WINDOW', '60'))  # seconds
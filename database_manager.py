@@ -1,8 +1,8 @@
 """PostgreSQL database manager for tracking CoC agreements."""
 import logging
 from contextlib import contextmanager
-from datetime import datetime, timezone
-from typing import List, Dict
+from datetime import date, datetime, timezone
+from typing import List, Dict, Optional
 
 import psycopg2
 import psycopg2.extras
@@ -55,6 +55,73 @@ class DatabaseManager:
                         value TEXT NOT NULL
                     )
                 """)
+                # Aggregates for /stats, maintained in the same transaction as the rows they count.
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS agreement_stats (
+                        group_id    BIGINT NOT NULL,
+                        coc_version TEXT NOT NULL,
+                        day         DATE NOT NULL,
+                        agreed      INTEGER NOT NULL,
+                        PRIMARY KEY (group_id, coc_version, day)
+                    )
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS agreement_totals (
+                        group_id    BIGINT NOT NULL,
+                        coc_version TEXT NOT NULL,
+                        agreed      INTEGER NOT NULL,
+                        PRIMARY KEY (group_id, coc_version)
+                    )
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS group_stats (
+                        group_id           BIGINT PRIMARY KEY,
+                        group_name         TEXT,
+                        pending_restricted INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS pending_restrictions (
+                        user_id       BIGINT NOT NULL,
+                        group_id      BIGINT NOT NULL,
+                        restricted_at TIMESTAMPTZ NOT NULL,
+                        agreed_at     TIMESTAMPTZ,
+                        PRIMARY KEY (user_id, group_id)
+                    )
+                """)
+                # Set once the user agrees; the row stays until the unrestriction is confirmed.
+                cur.execute("""
+                    ALTER TABLE pending_restrictions ADD COLUMN IF NOT EXISTS agreed_at TIMESTAMPTZ
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_pending_restrictions_unreleased
+                    ON pending_restrictions (agreed_at, user_id, group_id)
+                    WHERE agreed_at IS NOT NULL
+                """)
+                cur.execute("SELECT 1 FROM agreement_stats LIMIT 1")
+                if cur.fetchone() is None:
+                    # First start with stats tables: backfill from existing agreements.
+                    cur.execute("""
+                        INSERT INTO agreement_stats (group_id, coc_version, day, agreed)
+                        SELECT group_id, coc_version, (agreed_at AT TIME ZONE 'UTC')::date, COUNT(*)
+                        FROM agreements
+                        GROUP BY 1, 2, 3
+                    """)
+                    cur.execute("""
+                        INSERT INTO group_stats (group_id, group_name)
+                        SELECT DISTINCT ON (group_id) group_id, group_name
+                        FROM agreements
+                        ORDER BY group_id, agreed_at DESC
+                        ON CONFLICT (group_id) DO NOTHING
+                    """)
+                cur.execute("SELECT 1 FROM agreement_totals LIMIT 1")
+                if cur.fetchone() is None:
+                    cur.execute("""
+                        INSERT INTO agreement_totals (group_id, coc_version, agreed)
+                        SELECT group_id, coc_version, COUNT(*)
+                        FROM agreements
+                        GROUP BY 1, 2
+                    """)
 
     def get_setting(self, key: str, default: str = '') -> str:
         try:
@@ -64,7 +131,7 @@ class DatabaseManager:
                     row = cur.fetchone()
                     return row[0] if row else default
         except Exception as e:
-            logger.error(f"get_setting failed: {e}")
+            logger.error("get_setting failed: %s", e)
             return default
 
     def set_setting(self, key: str, value: str) -> bool:
@@ -77,7 +144,7 @@ class DatabaseManager:
                     """, (key, value))
             return True
         except Exception as e:
-            logger.error(f"set_setting failed: {e}")
+            logger.error("set_setting failed: %s", e)
             return False
 
     def record_agreement(
@@ -89,6 +156,7 @@ class DatabaseManager:
         group_name: str,
         version: str = COC_VERSION
     ) -> bool:
+        now = datetime.now(timezone.utc)
         try:
             with self._conn() as conn:
                 with conn.cursor() as cur:
@@ -101,12 +169,98 @@ class DatabaseManager:
                             full_name  = EXCLUDED.full_name,
                             group_name = EXCLUDED.group_name,
                             agreed_at  = EXCLUDED.agreed_at
+                        RETURNING (xmax = 0) AS inserted
                     """, (user_id, username or '', full_name or '', group_id,
-                          group_name or '', datetime.now(timezone.utc), version))
-            logger.info(f"Recorded agreement: user={user_id} group={group_id} version={version}")
+                          group_name or '', now, version))
+                    if cur.fetchone()[0]:
+                        cur.execute("""
+                            INSERT INTO agreement_stats (group_id, coc_version, day, agreed)
+                            VALUES (%s, %s, %s, 1)
+                            ON CONFLICT (group_id, coc_version, day) DO UPDATE SET
+                                agreed = agreement_stats.agreed + 1
+                        """, (group_id, version, now.date()))
+                        cur.execute("""
+                            INSERT INTO agreement_totals (group_id, coc_version, agreed)
+                            VALUES (%s, %s, 1)
+                            ON CONFLICT (group_id, coc_version) DO UPDATE SET
+                                agreed = agreement_totals.agreed + 1
+                        """, (group_id, version))
+                    cur.execute("""
+                        UPDATE pending_restrictions SET agreed_at = %s
+                        WHERE user_id = %s AND group_id = %s AND agreed_at IS NULL
+                    """, (now, user_id, group_id))
+                    cleared = cur.rowcount
+                    cur.execute("""
+                        INSERT INTO group_stats (group_id, group_name) VALUES (%s, %s)
+                        ON CONFLICT (group_id) DO UPDATE SET
+                            group_name         = EXCLUDED.group_name,
+                            pending_restricted = group_stats.pending_restricted - %s
+                    """, (group_id, group_name or '', cleared))
+            logger.info("Recorded agreement: user=%s group=%s version=%s", user_id, group_id, version,
+                        extra={'user_id': user_id, 'chat_id': group_id, 'audit': True})
+            return True
+        except Exception as e:
+            logger.error("record_agreement failed: %s", e)
+            return False
+
+    def mark_restricted(self, user_id: int, group_id: int, group_name: str) -> bool:
+        """Record that the bot restricted a user who has not agreed yet."""
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO pending_restrictions (user_id, group_id, restricted_at)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (user_id, group_id) DO UPDATE SET
+                            restricted_at = EXCLUDED.restricted_at,
+                            agreed_at     = NULL
+                        WHERE pending_restrictions.agreed_at IS NOT NULL
+                    """, (user_id, group_id, datetime.now(timezone.utc)))
+                    if cur.rowcount:
+                        cur.execute("""
+                            INSERT INTO group_stats (group_id, group_name, pending_restricted)
+                            VALUES (%s, %s, 1)
+                            ON CONFLICT (group_id) DO UPDATE SET
+                                group_name         = EXCLUDED.group_name,
+                                pending_restricted = group_stats.pending_restricted + 1
+                        """, (group_id, group_name or ''))
+            return True
+        except Exception as e:
+            logger.error("mark_restricted failed: %s", e)
+            return False
+
+    def clear_restricted(self, user_id: int, group_id: int) -> bool:
+        """Forget a pending restriction without an agreement, e.g. when the user leaves."""
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        DELETE FROM pending_restrictions WHERE user_id = %s AND group_id = %s
+                        RETURNING agreed_at IS NULL
+                    """, (user_id, group_id))
+                    row = cur.fetchone()
+                    if row and row[0]:
+                        cur.execute("""
+                            UPDATE group_stats SET pending_restricted = pending_restricted - 1
+                            WHERE group_id = %s
+                        """, (group_id,))
             return True
         except Exception as e:
-            logger.error(f"record_agreement failed: {e}")
+            logger.error("clear_restricted failed: %s", e)
+            return False
+
+    def release_restriction(self, user_id: int, group_id: int) -> bool:
+        """Forget a restriction once the user who agreed is confirmed unrestricted."""
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        DELETE FROM pending_restrictions
+                        WHERE user_id = %s AND group_id = %s AND agreed_at IS NOT NULL
+                    """, (user_id, group_id))
+            return True
+        except Exception as e:
+            logger.error("release_restriction failed: %s", e)
             return False
 
     def has_agreed(self, user_id: int, group_id: int, version: str = COC_VERSION) -> bool:
@@ -119,7 +273,7 @@ class DatabaseManager:
                     """, (user_id, group_id, version))
                     return cur.fetchone() is not None
         except Exception as e:
-            logger.error(f"has_agreed failed: {e}")
+            logger.error("has_agreed failed: %s", e)
             return False
 
     def has_agreed_anywhere(self, user_id: int, version: str = COC_VERSION) -> bool:
@@ -134,7 +288,7 @@ class DatabaseManager:
                     """, (user_id, version))
                     return cur.fetchone() is not None
         except Exception as e:
-            logger.error(f"has_agreed_anywhere failed: {e}")
+            logger.error("has_agreed_anywhere failed: %s", e)
             return False
 
     def get_all_agreed(self, group_id: int, version: str = COC_VERSION) -> List[Dict]:
@@ -149,5 +303,88 @@ class DatabaseManager:
                     """, (group_id, version))
                     return [dict(row) for row in cur.fetchall()]
         except Exception as e:
-            logger.error(f"get_all_agreed failed: {e}")
+            logger.error("get_all_agreed failed: %s", e)
+            return []
+
+    def get_unreleased_restrictions(self, until: datetime, limit: int = 100) -> List[Dict]:
+        """Return users the bot restricted who agreed before `until` but aren't confirmed unrestricted.
+
+        Oldest agreement first; rows leave this set via `release_restriction`.
+        """
+        try:
+            with self._conn() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT user_id, group_id, agreed_at
+                        FROM pending_restrictions
+                        WHERE agreed_at IS NOT NULL AND agreed_at < %s
+                        ORDER BY agreed_at, user_id, group_id
+                        LIMIT %s
+                    """, (until, limit))
+                    return [dict(row) for row in cur.fetchall()]
+        except Exception as e:
+            logger.error("get_unreleased_restrictions failed: %s", e)
+            return []
+
+    def queue_reconcile_backfill(self, version: str = COC_VERSION) -> bool:
+        """Queue every agreement under `version` for the reconciler, whoever restricted the user.
+
+        One-time opt-in for agreements recorded before restrictions were tracked.
+        """
+        try:
+            with self._conn() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO pending_restrictions (user_id, group_id, restricted_at, agreed_at)
+                        SELECT user_id, group_id, agreed_at, agreed_at
+                        FROM agreements
+                        WHERE coc_version = %s
+                        ON CONFLICT (user_id, group_id) DO NOTHING
+                    """, (version,))
+                    logger.info("Queued %s agreement(s) for reconciliation", cur.rowcount)
+            return True
+        except Exception as e:
+            logger.error("queue_reconcile_backfill failed: %s", e)
+            return False
+
+    def get_stats(
+        self,
+        group_id: Optional[int],
+        version: str,
+        since: Optional[date],
+        limit: int
+    ) -> List[Dict]:
+        """Return one row per group (at most `limit`, or just `group_id`) from the aggregate tables.
+
+        Each row has `totals` ({version: agreed}) and `daily` ([[day, agreed], ...] for `version`
+        from `since` onwards; empty when `since` is None). Cost does not grow with `agreements`.
+        """
+        try:
+            with self._conn() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute("""
+                        SELECT g.group_id, g.group_name, g.pending_restricted,
+                               COALESCE(t.totals, '{}') AS totals, COALESCE(d.daily, '[]') AS daily
+                        FROM (
+                            SELECT group_id, group_name, pending_restricted
+                            FROM group_stats
+                            WHERE %(group_id)s IS NULL OR group_id = %(group_id)s
+                            ORDER BY group_id
+                            LIMIT %(limit)s
+                        ) g
+                        LEFT JOIN LATERAL (
+                            SELECT json_object_agg(coc_version, agreed) AS totals
+                            FROM agreement_totals
+                            WHERE group_id = g.group_id
+                        ) t ON TRUE
+                        LEFT JOIN LATERAL (
+                            SELECT json_agg(json_build_array(day, agreed) ORDER BY day) AS daily
+                            FROM agreement_stats
+                            WHERE group_id = g.group_id AND coc_version = %(version)s AND day >= %(since)s
+                        ) d ON TRUE
+                        ORDER BY g.group_id
+                    """, {'group_id': group_id, 'version': version, 'since': since, 'limit': limit})
+                    return [dict(row) for row in cur.fetchall()]
+        except Exception as e:
+            logger.error("get_stats failed: %s", e)
             return []
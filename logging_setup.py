@@ -0,0 +1,125 @@
+"""Logging setup: records are queued on the event loop and written by a background thread.
+
+Formatting (including JSON serialisation) happens on the listener thread, and repeated
+below-ERROR messages are sampled per (logger, message template, user, chat) so floods of
+per-user events don't slow down the handlers that emit them.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_LIMIT, LOG_SAMPLE_WINDOW
+
+_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `event` is the unformatted template, handy for grouping."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": str(record.msg),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SampledQueueHandler(QueueHandler):
+    """QueueHandler that passes at most `limit` records per key per window.
+
+    The key is the logger, the message template and the `sample_key`/`user_id`/`chat_id`
+    extras, so one user repeating an event is sampled without hiding other users' events. ERROR and
+    above, and records logged with `extra={'audit': True}`, are never sampled. When a
+    window closes, one summary record is queued for each key that had records suppressed.
+    """
+
+    def __init__(self, log_queue, limit: int, window: float):
+        super().__init__(log_queue)
+        self._limit = limit
+        self._window = window
+        self._window_start = time.monotonic()
+        self._counts = {}
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default merges args into msg here, on the caller's thread; leave that to the listener.
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self._suppress(record):
+                return
+        except Exception:
+            self.handleError(record)
+        super().emit(record)
+
+    def _suppress(self, record: logging.LogRecord) -> bool:
+        if self._limit <= 0 or record.levelno >= logging.ERROR or getattr(record, 'audit', False):
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= self._window:
+            self._flush_suppressed(now)
+        key = (record.name, str(record.msg), getattr(record, 'sample_key', None),
+               getattr(record, 'user_id', None), getattr(record, 'chat_id', None))
+        seen = self._counts.get(key, 0) + 1
+        self._counts[key] = seen
+        return seen > self._limit
+
+    def _flush_suppressed(self, now: float) -> None:
+        elapsed = now - self._window_start
+        for (name, msg, _, user_id, chat_id), seen in self._counts.items():
+            if seen > self._limit:
+                summary = logging.LogRecord(
+                    name, logging.INFO, __file__, 0,
+                    "Suppressed %d repeats of %r in the last %.0fs", (seen - self._limit, msg, elapsed), None
+                )
+                summary.suppressed = seen - self._limit
+                if user_id is not None:
+                    summary.user_id = user_id
+                if chat_id is not None:
+                    summary.chat_id = chat_id
+                super().emit(summary)
+        self._counts.clear()
+        self._window_start = now
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            self._flush_suppressed(time.monotonic())
+        finally:
+            self.release()
+        super().close()
+
+
+def setup_logging() -> None:
+    """Route root logging through a sampled queue to a stderr writer thread."""
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(_TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    handler = SampledQueueHandler(log_queue, LOG_SAMPLE_LIMIT, LOG_SAMPLE_WINDOW)
+    listener = QueueListener(log_queue, output)
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    listener.start()
+
+    def _shutdown():
+        handler.close()
+        listener.stop()
+
+    atexit.register(_shutdown)
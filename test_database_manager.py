@@ -0,0 +1,124 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+from datetime import date
+
+os.environ.setdefault('BOT_TOKEN', '12345:ABC-DEF')
+os.environ.setdefault('DATABASE_URL', 'postgresql://test')
+
+from database_manager import DatabaseManager
+
+
+class TestStatsCounters(unittest.TestCase):
+    """Checks which counter statements run; the SQL itself needs a real PostgreSQL."""
+
+    def setUp(self):
+        self.cur = MagicMock()
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value = self.cur
+        connect = patch('database_manager.psycopg2.connect', return_value=conn)
+        connect.start()
+        self.addCleanup(connect.stop)
+        self.db = DatabaseManager()
+        self.cur.reset_mock()
+
+    def statements(self):
+        return [(" ".join(c.args[0].split()), c.args[1] if len(c.args) > 1 else None)
+                for c in self.cur.execute.call_args_list]
+
+    def find(self, prefix):
+        return [params for sql, params in self.statements() if sql.startswith(prefix)]
+
+    def record(self):
+        return self.db.record_agreement(100, 'user', 'User', -1001, 'Group', '2.0')
+
+    def test_new_agreement_bumps_daily_and_total_counters(self):
+        self.cur.fetchone.return_value = (True,)
+        self.cur.rowcount = 0
+
+        self.assertTrue(self.record())
+
+        (daily,) = self.find("INSERT INTO agreement_stats")
+        self.assertEqual(daily[:2], (-1001, '2.0'))
+        self.assertEqual(self.find("INSERT INTO agreement_totals"), [(-1001, '2.0')])
+        self.assertEqual(self.find("INSERT INTO group_stats"), [(-1001, 'Group', 0)])
+
+    def test_repeated_agreement_does_not_bump_counters(self):
+        self.cur.fetchone.return_value = (False,)
+        self.cur.rowcount = 0
+
+        self.assertTrue(self.record())
+
+        self.assertEqual(self.find("INSERT INTO agreement_stats"), [])
+        self.assertEqual(self.find("INSERT INTO agreement_totals"), [])
+
+    def test_agreement_clears_pending_restriction(self):
+        self.cur.fetchone.return_value = (True,)
+        self.cur.rowcount = 1
+
+        self.assertTrue(self.record())
+
+        (marked,) = self.find("UPDATE pending_restrictions SET agreed_at = %s")
+        self.assertEqual(marked[1:], (100, -1001))
+        (group_stats,) = self.find("INSERT INTO group_stats")
+        self.assertEqual(group_stats, (-1001, 'Group', 1))
+        sql = next(sql for sql, _ in self.statements() if sql.startswith("INSERT INTO group_stats"))
+        self.assertIn("pending_restricted = group_stats.pending_restricted - %s", sql)
+
+    def test_mark_restricted_increments_only_for_new_restriction(self):
+        self.cur.rowcount = 1
+        self.assertTrue(self.db.mark_restricted(100, -1001, 'Group'))
+        sql, params = self.statements()[-1]
+        self.assertIn("pending_restricted = group_stats.pending_restricted + 1", sql)
+        self.assertEqual(params, (-1001, 'Group'))
+
+        self.cur.reset_mock()
+        self.cur.rowcount = 0
+        self.assertTrue(self.db.mark_restricted(100, -1001, 'Group'))
+        self.assertEqual(self.find("INSERT INTO group_stats"), [])
+
+    def test_mark_restricted_rearms_agreed_restriction(self):
+        self.cur.rowcount = 1
+        self.db.mark_restricted(100, -1001, 'Group')
+
+        sql = self.statements()[0][0]
+        self.assertIn("agreed_at = NULL WHERE pending_restrictions.agreed_at IS NOT NULL", sql)
+
+    def test_clear_restricted_decrements_only_when_still_pending(self):
+        self.cur.fetchone.return_value = (True,)
+        self.assertTrue(self.db.clear_restricted(100, -1001))
+        self.assertEqual(self.find("UPDATE group_stats SET pending_restricted = pending_restricted - 1"),
+                         [(-1001,)])
+
+        for row in [(False,), None]:
+            self.cur.reset_mock()
+            self.cur.fetchone.return_value = row
+            self.assertTrue(self.db.clear_restricted(100, -1001))
+            self.assertEqual(self.find("UPDATE group_stats"), [])
+
+    def test_release_only_removes_agreed_restrictions(self):
+        self.assertTrue(self.db.release_restriction(100, -1001))
+
+        (sql, params), = self.statements()
+        self.assertTrue(sql.endswith("AND agreed_at IS NOT NULL"))
+        self.assertEqual(params, (100, -1001))
+
+    def test_stats_are_one_bounded_query(self):
+        self.cur.fetchall.return_value = []
+        self.db.get_stats(None, '2.0', date(2026, 10, 5), 51)
+
+        (sql, params), = self.statements()
+        self.assertIn("LIMIT %(limit)s", sql)
+        self.assertIn("day >= %(since)s", sql)
+        self.assertNotIn("FROM agreements", sql)
+        self.assertEqual(params, {'group_id': None, 'version': '2.0', 'since': date(2026, 10, 5), 'limit': 51})
+
+    def test_failures_are_reported_not_raised(self):
+        self.cur.execute.side_effect = Exception("connection lost")
+        self.assertFalse(self.record())
+        self.assertFalse(self.db.mark_restricted(100, -1001, 'Group'))
+        self.assertFalse(self.db.clear_restricted(100, -1001))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import os
+
+os.environ.setdefault('BOT_TOKEN', '12345:ABC-DEF')
+os.environ.setdefault('DATABASE_URL', 'postgresql://test')
+
+from telegram.constants import ChatMemberStatus
+from telegram.error import BadRequest
+
+with patch('database_manager.DatabaseManager') as _db:
+    _db.return_value.get_setting.return_value = '1.0'
+    import bot
+
+
+class HandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = MagicMock()
+        self.storage.has_agreed.return_value = False
+        self.storage.has_agreed_anywhere.return_value = False
+        self.context = MagicMock()
+        self.context.bot = AsyncMock()
+        patches = [
+            patch('bot.storage_manager', self.storage),
+            patch('bot.DRY_RUN', False),
+            patch('bot.ADMIN_IDS', [1]),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+
+class TestGatekeeperLogging(HandlerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.update = MagicMock()
+        self.update.effective_user = MagicMock(id=100, is_bot=False)
+        self.update.effective_chat = MagicMock(id=-1001, type='group', title='Test Group')
+        self.update.effective_message = AsyncMock()
+
+    def run_gatekeeper(self):
+        with self.assertLogs('bot', level='INFO') as logs:
+            asyncio.run(bot.gatekeeper_handler(self.update, self.context))
+        return {record.msg: record for record in logs.records}
+
+    def test_blocking_line_is_sampled_restriction_is_audited(self):
+        records = self.run_gatekeeper()
+
+        blocking = records["Gatekeeper: blocking user=%s in chat=%s"]
+        self.assertFalse(getattr(blocking, 'audit', False))
+        self.assertEqual((blocking.user_id, blocking.chat_id), (100, -1001))
+        self.assertTrue(records["Restricted user %s in chat %s"].audit)
+        self.storage.mark_restricted.assert_called_once_with(100, -1001, 'Test Group')
+
+    def test_failed_restriction_is_not_audited(self):
+        self.context.bot.restrict_chat_member.side_effect = BadRequest("Not enough rights")
+        records = self.run_gatekeeper()
+
+        self.assertNotIn("Restricted user %s in chat %s", records)
+        self.assertIn("Failed to restrict user %s: %s", records)
+        self.storage.mark_restricted.assert_not_called()
+
+
+def _member(status, is_member=True, user_id=100):
+    return MagicMock(status=status, is_member=is_member, user=MagicMock(id=user_id, is_bot=False))
+
+
+class TestNewMemberLeaving(HandlerTestCase):
+
+    def run_transition(self, old, new):
+        update = MagicMock()
+        update.chat_member.old_chat_member = old
+        update.chat_member.new_chat_member = new
+        update.effective_chat = MagicMock(id=-1001, title='Test Group')
+        asyncio.run(bot.handle_new_member(update, self.context))
+
+    def test_left_member_is_cleared(self):
+        self.run_transition(_member(ChatMemberStatus.MEMBER), _member(ChatMemberStatus.LEFT))
+        self.storage.clear_restricted.assert_called_once_with(100, -1001)
+
+    def test_restricted_member_leaving_is_cleared(self):
+        self.run_transition(_member(ChatMemberStatus.RESTRICTED),
+                            _member(ChatMemberStatus.RESTRICTED, is_member=False))
+        self.storage.clear_restricted.assert_called_once_with(100, -1001)
+        self.context.bot.restrict_chat_member.assert_not_called()
+
+    def test_restricted_member_rejoining_is_restricted_again(self):
+        self.run_transition(_member(ChatMemberStatus.RESTRICTED, is_member=False),
+                            _member(ChatMemberStatus.RESTRICTED))
+        self.storage.clear_restricted.assert_not_called()
+        self.context.bot.restrict_chat_member.assert_called_once()
+        self.storage.mark_restricted.assert_called_once_with(100, -1001, 'Test Group')
+
+    def test_member_being_restricted_is_not_cleared(self):
+        self.run_transition(_member(ChatMemberStatus.MEMBER), _member(ChatMemberStatus.RESTRICTED))
+        self.storage.clear_restricted.assert_not_called()
+
+
+class TestStatsCommand(HandlerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.update = MagicMock()
+        self.update.effective_user = MagicMock(id=1)
+        self.update.effective_chat = MagicMock(id=-1001, type='group')
+        self.update.message.reply_text = AsyncMock()
+        version = patch('bot._active_coc_version', '2.0')
+        version.start()
+        self.addCleanup(version.stop)
+
+    def run_stats(self):
+        asyncio.run(bot.stats(self.update, self.context))
+        return [c.args[0] for c in self.update.message.reply_text.call_args_list]
+
+    def _row(self, group_id, totals, daily=(), pending=0, name=None):
+        return {'group_id': group_id, 'group_name': name or f"Group {group_id}",
+                'pending_restricted': pending, 'totals': totals, 'daily': list(daily)}
+
+    def test_group_view_lists_active_version_first(self):
+        self.storage.get_stats.return_value = [
+            self._row(-1001, {'1.0': 7, '2.0': 3, '0.9': 1}, [['2026-10-17', 1], ['2026-10-18', 2]], pending=4)
+        ]
+        (reply,) = self.run_stats()
+
+        self.assertEqual(reply.splitlines()[1:5], [
+            "Agreed to v2.0: 3", "Agreed to v0.9: 1", "Agreed to v1.0: 7", "Restricted, not yet agreed: 4",
+        ])
+        self.assertIn("• 2026-10-18: 2", reply)
+        group_id, version, since, limit = self.storage.get_stats.call_args.args
+        self.assertEqual((group_id, version, limit), (-1001, '2.0', bot._STATS_MAX_GROUPS + 1))
+        self.assertIsNotNone(since)
+
+    def test_group_without_active_version_agreements_shows_zero(self):
+        self.storage.get_stats.return_value = [self._row(-1001, {'1.0': 5})]
+        (reply,) = self.run_stats()
+        self.assertIn("Agreed to v2.0: 0", reply)
+
+    def test_private_view_reads_all_groups_without_daily_rows(self):
+        self.update.effective_chat.type = 'private'
+        self.storage.get_stats.return_value = [self._row(-1, {'2.0': 1})]
+        self.run_stats()
+
+        group_id, _, since, _ = self.storage.get_stats.call_args.args
+        self.assertIsNone(group_id)
+        self.assertIsNone(since)
+
+    def test_long_reply_is_split_under_telegram_limit(self):
+        self.update.effective_chat.type = 'private'
+        self.storage.get_stats.return_value = [
+            self._row(-i, {'2.0': i, '1.0': i}, name="G" * 100) for i in range(1, bot._STATS_MAX_GROUPS + 2)
+        ]
+        replies = self.run_stats()
+
+        self.assertGreater(len(replies), 1)
+        self.assertTrue(all(len(r) <= bot._TELEGRAM_MESSAGE_LIMIT for r in replies))
+        text = "\n\n".join(replies)
+        self.assertEqual(text.count("📊"), bot._STATS_MAX_GROUPS)
+        self.assertTrue(replies[-1].endswith(f"(limit {bot._STATS_MAX_GROUPS})."))
+
+    def test_no_stats(self):
+        self.storage.get_stats.return_value = []
+        self.assertEqual(self.run_stats(), ["No statistics recorded yet."])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch
+import json
+import logging
+import os
+import queue
+
+os.environ.setdefault('BOT_TOKEN', '12345:ABC-DEF')
+os.environ.setdefault('DATABASE_URL', 'postgresql://test')
+
+from logging_setup import JsonFormatter, SampledQueueHandler
+
+
+class TestSampledQueueHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        clock = patch('logging_setup.time.monotonic', lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+        self.queue = queue.SimpleQueue()
+        self.handler = SampledQueueHandler(self.queue, limit=2, window=60)
+        self.logger = logging.getLogger(f"test_logging_setup.{self._testMethodName}")
+        self.logger.handlers = [self.handler]
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def drain(self):
+        records = []
+        while not self.queue.empty():
+            records.append(self.queue.get())
+        return records
+
+    def test_limit_applies_per_template_and_user(self):
+        for _ in range(5):
+            self.logger.info("Sent CoC DM to user %s", 1, extra={'user_id': 1})
+        self.logger.info("Sent CoC DM to user %s", 2, extra={'user_id': 2})
+
+        records = self.drain()
+        self.assertEqual([r.getMessage() for r in records],
+                         ["Sent CoC DM to user 1", "Sent CoC DM to user 1", "Sent CoC DM to user 2"])
+
+    def test_sample_key_separates_shared_templates(self):
+        for handler in ['gatekeeper_handler', 'handle_agreement']:
+            for _ in range(3):
+                self.logger.warning("Slow update in %s", handler, extra={'sample_key': handler})
+        self.assertEqual(len(self.drain()), 4)
+
+    def test_errors_and_audit_events_are_never_sampled(self):
+        for _ in range(5):
+            self.logger.error("Failed to restrict user %s", 1, extra={'user_id': 1})
+            self.logger.info("Gatekeeper: blocking user=%s", 1, extra={'user_id': 1, 'audit': True})
+        self.assertEqual(len(self.drain()), 10)
+
+    def test_window_rollover_emits_summary(self):
+        for _ in range(5):
+            self.logger.info("Sent CoC DM to user %s", 1, extra={'user_id': 1, 'chat_id': -1})
+        self.drain()
+
+        self.now += 61
+        self.logger.info("Sent CoC DM to user %s", 1, extra={'user_id': 1, 'chat_id': -1})
+
+        summary, record = self.drain()
+        self.assertEqual(summary.suppressed, 3)
+        self.assertEqual((summary.user_id, summary.chat_id), (1, -1))
+        self.assertEqual(summary.getMessage(), "Suppressed 3 repeats of 'Sent CoC DM to user %s' in the last 61s")
+        self.assertEqual(record.getMessage(), "Sent CoC DM to user 1")
+
+    def test_close_flushes_suppressed_counts(self):
+        for _ in range(4):
+            self.logger.warning("Could not DM user %s", 1, extra={'user_id': 1})
+        self.drain()
+
+        self.handler.close()
+
+        (summary,) = self.drain()
+        self.assertEqual(summary.suppressed, 2)
+
+    def test_unhashable_message_does_not_raise(self):
+        self.logger.info({"a": 1})
+        self.logger.info("user %s", 1, extra={'user_id': [1]})
+
+        self.assertEqual(len(self.drain()), 2)
+
+    def test_records_are_queued_unformatted(self):
+        self.logger.info("Recorded agreement: user=%s", 1)
+
+        (record,) = self.drain()
+        self.assertEqual(record.msg, "Recorded agreement: user=%s")
+        self.assertEqual(record.args, (1,))
+
+
+class TestJsonFormatter(unittest.TestCase):
+
+    def test_includes_template_and_extras(self):
+        record = logging.LogRecord('bot', logging.INFO, __file__, 0, "blocking user=%s", (1,), None)
+        record.user_id = 1
+
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['event'], "blocking user=%s")
+        self.assertEqual(entry['message'], "blocking user=1")
+        self.assertEqual(entry['user_id'], 1)
+        self.assertEqual(entry['level'], 'INFO')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('BOT_TOKEN', '12345:ABC-DEF')
+os.environ.setdefault('DATABASE_URL', 'postgresql://test')
+
+from telegram.constants import ChatMemberStatus
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+with patch('database_manager.DatabaseManager') as _db:
+    _db.return_value.get_setting.return_value = '1.0'
+    import bot
+
+
+class FakeStorage:
+    """Just enough of DatabaseManager for the reconciler: settings plus the restriction queue."""
+
+    def __init__(self, rows=None):
+        self.settings = {}
+        self.rows = list(rows or [])
+        self.backfilled = []
+
+    def get_setting(self, key, default=''):
+        return self.settings.get(key, default)
+
+    def set_setting(self, key, value):
+        self.settings[key] = value
+        return True
+
+    def get_unreleased_restrictions(self, until, limit):
+        return [row for row in self.rows if row['agreed_at'] < until][:limit]
+
+    def release_restriction(self, user_id, group_id):
+        self.rows = [r for r in self.rows if (r['user_id'], r['group_id']) != (user_id, group_id)]
+        return True
+
+    def queue_reconcile_backfill(self, version):
+        self.backfilled.append(version)
+        return True
+
+
+def _row(n):
+    return {'user_id': 100 + n, 'group_id': -1000 - n,
+            'agreed_at': datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=n)}
+
+
+def _restricted():
+    return MagicMock(status=ChatMemberStatus.RESTRICTED, can_send_messages=False)
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [_row(1), _row(2), _row(3)]
+        self.storage = FakeStorage(self.rows)
+        self.context = MagicMock()
+        self.context.bot = AsyncMock()
+        self.context.bot.get_chat_member.return_value = _restricted()
+        patches = [
+            patch('bot.storage_manager', self.storage),
+            patch('bot.RECONCILE_PACE', 0),
+            patch('bot.RECONCILE_BACKFILL', False),
+            patch('bot.DRY_RUN', False),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def run_job(self):
+        asyncio.run(bot.reconcile_restrictions(self.context))
+
+    def remaining(self):
+        return [row['user_id'] for row in self.storage.rows]
+
+    def test_restricted_members_are_unrestricted_and_released(self):
+        self.context.bot.get_chat_member.side_effect = [
+            _restricted(),
+            MagicMock(status=ChatMemberStatus.MEMBER, can_send_messages=True),
+            _restricted(),
+        ]
+        self.run_job()
+
+        self.assertEqual(self.context.bot.restrict_chat_member.call_count, 2)
+        kwargs = self.context.bot.restrict_chat_member.call_args.kwargs
+        self.assertEqual(kwargs['user_id'], self.rows[2]['user_id'])
+        self.assertTrue(kwargs['permissions'].can_send_messages)
+        self.assertEqual(self.remaining(), [])
+
+    def test_agreements_inside_grace_period_are_left_alone(self):
+        fresh = {'user_id': 200, 'group_id': -2000, 'agreed_at': datetime.now(timezone.utc)}
+        self.storage.rows = [fresh]
+        self.run_job()
+
+        self.context.bot.get_chat_member.assert_not_called()
+        self.assertEqual(self.remaining(), [200])
+
+    def test_retry_after_keeps_failed_row_queued(self):
+        self.context.bot.get_chat_member.side_effect = [_restricted(), RetryAfter(30), _restricted()]
+        self.run_job()
+
+        self.assertEqual(self.context.bot.get_chat_member.call_count, 2)
+        self.assertEqual(self.remaining(), [102, 103])
+
+    def test_transient_error_keeps_failed_row_queued(self):
+        self.context.bot.restrict_chat_member.side_effect = [None, TimedOut()]
+        self.run_job()
+
+        self.assertEqual(self.context.bot.get_chat_member.call_count, 2)
+        self.assertEqual(self.remaining(), [102, 103])
+
+        self.context.bot.restrict_chat_member.side_effect = None
+        self.run_job()
+        self.assertEqual(self.remaining(), [])
+
+    def test_permanent_error_releases_row(self):
+        self.context.bot.get_chat_member.side_effect = [
+            _restricted(), BadRequest("User not found"), _restricted()
+        ]
+        self.run_job()
+
+        self.assertEqual(self.context.bot.restrict_chat_member.call_count, 2)
+        self.assertEqual(self.remaining(), [])
+
+    def test_dry_run_only_logs(self):
+        with patch('bot.DRY_RUN', True):
+            self.run_job()
+
+        self.context.bot.restrict_chat_member.assert_not_called()
+
+    def test_backfill_is_opt_in_and_runs_once(self):
+        self.run_job()
+        self.assertEqual(self.storage.backfilled, [])
+
+        with patch('bot.RECONCILE_BACKFILL', True):
+            self.run_job()
+            self.run_job()
+        self.assertEqual(self.storage.backfilled, [bot._active_coc_version])
+        self.assertEqual(self.storage.settings['reconcile_backfilled'], bot._active_coc_version)
+
+
+if __name__ == '__main__':
+    unittest.main()
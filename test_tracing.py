@@ -0,0 +1,134 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+import os
+
+os.environ.setdefault('BOT_TOKEN', '12345:ABC-DEF')
+os.environ.setdefault('DATABASE_URL', 'postgresql://test')
+
+import tracing
+
+
+class FakeStorage:
+
+    def has_agreed(self, user_id, group_id, version):
+        return user_id == 1
+
+    def _private(self):
+        return 'untimed'
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            patch('tracing.TRACE_UPDATES', True),
+            patch('tracing.SLOW_UPDATE_MS', 0),
+            patch('tracing.PROFILE_SAMPLE_RATE', 0),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        tracing._profile.clear()
+        tracing._profiled_updates = 0
+
+    def test_disabled_tracing_returns_originals(self):
+        async def handler():
+            pass
+
+        storage = FakeStorage()
+        with patch('tracing.TRACE_UPDATES', False):
+            self.assertIs(tracing.traced(handler), handler)
+            self.assertIs(tracing.instrument(storage, 'db'), storage)
+
+    def test_traced_handler_records_proxy_spans_in_slow_update_log(self):
+        storage = tracing.instrument(FakeStorage(), 'db')
+
+        async def handler(user_id):
+            first = storage.has_agreed(user_id, -1, '1.0')
+            storage.has_agreed(2, -1, '1.0')
+            return first, storage._private()
+
+        with self.assertLogs('tracing', level='WARNING') as logs:
+            result = asyncio.run(tracing.traced(handler)(1))
+
+        self.assertEqual(result, (True, 'untimed'))
+        self.assertEqual(len(logs.records), 1)
+        record = logs.records[0]
+        self.assertEqual(record.handler, 'handler')
+        self.assertEqual(record.sample_key, 'handler')
+        self.assertEqual([s['span'] for s in record.spans], ['db.has_agreed', 'db.has_agreed'])
+        self.assertIn('db.has_agreed=', record.getMessage())
+        self.assertNotIn('{', record.getMessage())
+
+    def test_slow_update_log_carries_user_and_chat(self):
+        async def handler(update, context):
+            pass
+
+        update = MagicMock()
+        update.effective_user.id = 100
+        update.effective_chat.id = -1001
+        with self.assertLogs('tracing', level='WARNING') as logs:
+            asyncio.run(tracing.traced(handler)(update, None))
+
+        record = logs.records[0]
+        self.assertEqual((record.user_id, record.chat_id), (100, -1001))
+
+    def test_bot_api_calls_are_recorded_as_spans(self):
+        request = tracing.TracingRequest()
+
+        async def handler():
+            await request.do_request("https://api.telegram.org/bot123:ABC/deleteMessage", "POST")
+
+        parent = AsyncMock(return_value=(200, b'{"ok": true}'))
+        with patch.object(tracing.HTTPXRequest, 'do_request', parent), \
+                self.assertLogs('tracing', level='WARNING') as logs:
+            asyncio.run(tracing.traced(handler)())
+
+        parent.assert_awaited_once()
+        self.assertEqual(parent.call_args.args[0], "https://api.telegram.org/bot123:ABC/deleteMessage")
+        self.assertEqual([s['span'] for s in logs.records[0].spans], ['bot.deleteMessage'])
+
+    def test_configure_installs_tracing_request_only_when_enabled(self):
+        builder = MagicMock()
+        with patch('tracing.TRACE_UPDATES', False):
+            self.assertIs(tracing.configure(builder), builder)
+        builder.request.assert_not_called()
+
+        self.assertIs(tracing.configure(builder), builder.request.return_value)
+        self.assertIsInstance(builder.request.call_args.args[0], tracing.TracingRequest)
+
+    def test_fast_update_is_not_logged(self):
+        async def handler():
+            pass
+
+        with patch('tracing.SLOW_UPDATE_MS', 60_000), patch.object(tracing.logger, 'warning') as warning:
+            asyncio.run(tracing.traced(handler)())
+        warning.assert_not_called()
+
+    def test_proxy_outside_trace_records_nothing(self):
+        storage = tracing.instrument(FakeStorage(), 'db')
+        self.assertTrue(storage.has_agreed(1, -1, '1.0'))
+        self.assertIsNone(tracing._current_trace.get())
+
+    def test_sampled_updates_are_aggregated_and_dumped(self):
+        with patch('tracing.PROFILE_DUMP_EVERY', 2):
+            tracing._aggregate('gatekeeper_handler', 30.0, [('db.has_agreed', 10.0), ('bot.deleteMessage', 15.0)])
+            self.assertEqual(tracing._profile['db.has_agreed'], [1, 10.0, 10.0])
+
+            with self.assertLogs('tracing', level='INFO') as logs:
+                tracing._aggregate('gatekeeper_handler', 50.0, [('db.has_agreed', 20.0)])
+
+        record = logs.records[0]
+        self.assertEqual(record.args[0], 2)
+        hot = record.hot_spans
+        self.assertEqual(hot[0]['span'], 'handler.gatekeeper_handler')
+        self.assertEqual(hot[0]['total_ms'], 80.0)
+        db = next(h for h in hot if h['span'] == 'db.has_agreed')
+        self.assertEqual((db['count'], db['avg_ms'], db['max_ms']), (2, 15.0, 20.0))
+        self.assertEqual(tracing._profile, {})
+        self.assertEqual(tracing._profiled_updates, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Opt-in per-update tracing and sampled span profiling.
+
+When TRACE_UPDATES is off, `traced`, `instrument` and `configure` hand back the
+original objects untouched, so disabled tracing adds no per-call overhead.
+"""
+import functools
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from telegram.request import HTTPXRequest
+
+from config import TRACE_UPDATES, SLOW_UPDATE_MS, PROFILE_SAMPLE_RATE, PROFILE_DUMP_EVERY
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('_current_trace', default=None)
+
+# span name -> [count, total_ms, max_ms], aggregated over sampled updates
+_profile: Dict[str, List[float]] = {}
+_profiled_updates = 0
+
+
+def _record(name: str, elapsed_ms: float) -> None:
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append((name, elapsed_ms))
+
+
+def _aggregate(handler_name: str, total_ms: float, spans: List[Tuple[str, float]]) -> None:
+    global _profiled_updates
+    for name, ms in [(f"handler.{handler_name}", total_ms)] + spans:
+        stats = _profile.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += ms
+        stats[2] = max(stats[2], ms)
+    _profiled_updates += 1
+    if _profiled_updates >= PROFILE_DUMP_EVERY:
+        dump_profile()
+
+
+def dump_profile() -> None:
+    """Log aggregated span timings (hottest first) and reset the profile."""
+    global _profiled_updates
+    if not _profile:
+        return
+    hot = sorted(_profile.items(), key=lambda item: item[1][1], reverse=True)[:20]
+    breakdown = [
+        {"span": name, "count": int(count), "total_ms": round(total, 1),
+         "avg_ms": round(total / count, 1), "max_ms": round(peak, 1)}
+        for name, (count, total, peak) in hot
+    ]
+    logger.info("Profile over %d sampled updates: %s", _profiled_updates,
+                ", ".join(f"{s['span']}={s['total_ms']}ms/{s['count']}" for s in breakdown),
+                extra={'hot_spans': breakdown})
+    _profile.clear()
+    _profiled_updates = 0
+
+
+def _log_slow_update(handler_name: str, total_ms: float, spans: List[Tuple[str, float]], args) -> None:
+    extra = {
+        'handler': handler_name,
+        'total_ms': round(total_ms, 1),
+        'spans': [{"span": name, "ms": round(ms, 1)} for name, ms in spans],
+        # Sample per handler (and per user/chat below) so one busy handler can't hide the others.
+        'sample_key': handler_name,
+    }
+    update = args[0] if args else None
+    user = getattr(update, 'effective_user', None)
+    chat = getattr(update, 'effective_chat', None)
+    if user is not None:
+        extra['user_id'] = user.id
+    if chat is not None:
+        extra['chat_id'] = chat.id
+    logger.warning("Slow update in %s: %.1fms (%s)", handler_name, total_ms,
+                   ", ".join(f"{name}={ms:.1f}ms" for name, ms in spans), extra=extra)
+
+
+def traced(handler):
+    """Wrap an async handler so DB and Bot API calls made while it runs are timed."""
+    if not TRACE_UPDATES:
+        return handler
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        spans: List[Tuple[str, float]] = []
+        token = _current_trace.set(spans)
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            _current_trace.reset(token)
+            if total_ms >= SLOW_UPDATE_MS:
+                _log_slow_update(handler.__name__, total_ms, spans, args)
+            if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+                _aggregate(handler.__name__, total_ms, spans)
+
+    return wrapper
+
+
+class _InstrumentedProxy:
+    """Forwards attribute access to `target`, timing every method call as a span."""
+
+    def __init__(self, target, prefix: str):
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        span_name = f"{self._prefix}.{name}"
+
+        @functools.wraps(attr)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                _record(span_name, (time.perf_counter() - start) * 1000)
+
+        return timed
+
+
+def instrument(target, prefix: str):
+    """Return `target` wrapped so its public method calls are recorded as spans."""
+    if not TRACE_UPDATES:
+        return target
+    return _InstrumentedProxy(target, prefix)
+
+
+class TracingRequest(HTTPXRequest):
+    """HTTPXRequest that records each Bot API call (named by its endpoint) as a span."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            _record(f"bot.{url.rsplit('/', 1)[-1]}", (time.perf_counter() - start) * 1000)
+
+
+def configure(builder):
+    """Install the tracing request layer on an ApplicationBuilder when tracing is enabled."""
+    if TRACE_UPDATES:
+        # Same pool size PTB uses for the bot's default request object.
+        builder = builder.request(TracingRequest(connection_pool_size=256))
+    return builder